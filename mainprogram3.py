@@ -1,39 +1,78 @@
 #!/usr/bin/env python3
 import time
 import os
-import glob
-import RPi.GPIO as GPIO
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
 import vlc
-from luma.core.interface.serial import i2c
-from luma.core.render import canvas
-from luma.oled.device import ssd1306
-from PIL import ImageFont
+from player.oled import BulkI2C, FastSSD1306
+from player.display import GlyphCache, fit_text
+from player.gpio import Buttons
+from PIL import Image, ImageDraw, ImageFont
 
 # Define GPIO pins for buttons
 PLAY_PAUSE_BTN = 11
 PREV_BTN = 13
 NEXT_BTN = 15
+DEBOUNCE_MS = 200  # further edges on a pin are ignored for this long
+SETTLE_MS = 5     # a press must hold the pin low this long to count
+SEEK_STEP_MS = 15000  # prev/next jump while playing
+SEEK_CHAIN_S = 1.0    # seeks this close together build on the previous target
+PARSE_TIMEOUT_MS = 2000  # give up reading a track's tags after this long
 
 # Music directory configuration
 MUSIC_DIR = "/home/fran/music"
-SUPPORTED_FORMATS = ['.mp3', '.flac', '.wav', '.ogg', '.m4a']
+SUPPORTED_FORMATS = ['.mp3', '.flac', '.wav', '.ogg', '.m4a', '.opus']
+SUPPORTED_EXTS = frozenset(ext.lstrip('.') for ext in SUPPORTED_FORMATS)
 
 # OLED Display Configuration
+COUNTER_POS = (10, 10)
+NAME_POS = (10, 40)
+ICON_POS = (100, 10)
+STATE_ICONS = {True: "▶", False: "⏸"}  # keyed by is_playing
 OLED_WIDTH = 128
 OLED_HEIGHT = 64
 OLED_ADDR = 0x3C
 
+def scan_music(directory):
+    """Yield the path of every supported music file below directory"""
+    # os.scandir hands back the file type with each entry, so no extra stat()
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                # Skip hidden files/folders and macOS "._" resource forks
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                _, dot, ext = entry.name.rpartition('.')
+                if dot and ext.lower() in SUPPORTED_EXTS:
+                    yield entry.path
+
+@dataclass
+class TrackView:
+    """What the track screen shows; compared whole to skip redraws"""
+    __slots__ = ('number', 'total', 'name', 'playing')
+    number: int
+    total: int
+    name: str
+    playing: bool
+
 class MP3Player:
     def __init__(self):
         # Initialize GPIO
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(PLAY_PAUSE_BTN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(PREV_BTN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(NEXT_BTN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.buttons = Buttons('BOARD')
         
         # Initialize OLED display with luma.oled
-        serial = i2c(port=1, address=OLED_ADDR)
-        self.device = ssd1306(serial, width=OLED_WIDTH, height=OLED_HEIGHT)
+        serial = BulkI2C(port=1, address=OLED_ADDR)
+        self.device = FastSSD1306(serial, width=OLED_WIDTH, height=OLED_HEIGHT)
+        # One canvas for every screen, cleared instead of reallocated
+        self.canvas = Image.new(self.device.mode, self.device.size)
+        self.canvas_draw = ImageDraw.Draw(self.canvas)
+        self._last_view = None  # what update_display last put on the panel
         
         # Load fonts for display
         try:
@@ -43,24 +82,48 @@ class MP3Player:
             # Fallback to default font if DejaVu is not available
             self.font = ImageFont.load_default()
             self.small_font = ImageFont.load_default()
+        # The counter and state icon are pasted from pre-rendered glyphs;
+        # PIL's built-in bitmap font keeps going through draw.text
+        self.glyphs = None
+        if isinstance(self.font, ImageFont.FreeTypeFont):
+            self.glyphs = GlyphCache(self.font, "0123456789/" + "".join(STATE_ICONS.values()))
+        # Both state icons pre-packed as page bytes, so a bare play/pause
+        # flip patches the last frame instead of redrawing it
+        self.icon_tiles = self._pack_icons() if self.glyphs is not None else None
+        self._last_buf = None  # page bytes of the last frame sent
         
         # Show initialization message
-        with canvas(self.device) as draw:
+        with self.frame() as draw:
             draw.text((10, 10), "Starting...", font=self.font, fill="white")
         
         # Initialize VLC instance and player
         self.vlc_instance = vlc.Instance('--no-xlib')
         self.player = self.vlc_instance.media_player_new()
         
-        # Initialize button states
-        self.last_play_pause_state = GPIO.input(PLAY_PAUSE_BTN)
-        self.last_prev_state = GPIO.input(PREV_BTN)
-        self.last_next_state = GPIO.input(NEXT_BTN)
+        # VLC reports the end of a track on its own thread, where calling
+        # back into libvlc can deadlock; just wake the main loop
+        self.track_ended = threading.Event()
+        events = self.player.event_manager()
+        for event in (vlc.EventType.MediaPlayerEndReached,
+                      vlc.EventType.MediaPlayerEncounteredError):
+            events.event_attach(event, lambda _event: self.track_ended.set())
+        
+        # Buttons run on the GPIO library's callback thread, so they, the
+        # main loop and the display thread take turns on VLC through this lock
+        self.lock = threading.Lock()
+        # VLC's parsed events can ask for a redraw before the display
+        # thread starts; the request then waits for it here
+        self.redraw = threading.Event()
         
         # Track list and current position
         self.tracks = []
         self.current_track_index = 0
         self.is_playing = False
+        self._seek_target = 0  # where the last seek sent playback, in ms
+        self._seek_at = 0.0    # monotonic time of that seek
+        self._name = "No track"  # current track's name, fitted to its line
+        self._titles = {}     # path -> tag title once VLC has parsed it, fitted to its line
+        self._pending = None  # (media, path) still being parsed
         
         # Load tracks
         self.load_tracks()
@@ -71,27 +134,62 @@ class MP3Player:
         
         # Update display with initial state
         self.update_display()
+        
+        # Only the display thread draws once we're running; everyone else
+        # calls mark_dirty(), and requests made while it is busy collapse
+        # into one redraw, so a button never waits for the I2C write
+        self.display_lock = threading.Lock()
+        threading.Thread(target=self._display_loop, daemon=True).start()
+        
+        for pin, handler in ((PLAY_PAUSE_BTN, self.handle_play_pause),
+                             (PREV_BTN, self.handle_prev),
+                             (NEXT_BTN, self.handle_next)):
+            self.buttons.watch(pin, lambda ch, handler=handler: self.on_button(handler, ch),
+                               DEBOUNCE_MS, SETTLE_MS)
     
+    @contextmanager
+    def frame(self):
+        """Like luma's canvas(), but redraws the shared canvas in place"""
+        # Whatever gets drawn replaces the track screen
+        self._last_view = None
+        draw = self.canvas_draw
+        draw.rectangle((0, 0) + self.device.size, fill="black")
+        yield draw
+        # Not reached if drawing raised, so half-drawn frames never show
+        buf = self.device.pack(self.canvas)
+        self.device.display_buffer(buf)
+        self._last_buf = buf
+
+    def _pack_icons(self):
+        """Return (pages, first column, {is_playing: bytes per page}) for the icon box"""
+        x, y = ICON_POS
+        width = self.device.width
+        # One box that covers either icon, so each tile fully erases the other
+        boxes = [self.font.getbbox(icon) for icon in STATE_ICONS.values()]
+        right = min(x + max(box[2] for box in boxes), width)
+        pages = range((y + min(box[1] for box in boxes)) // 8,
+                      (y + max(box[3] for box in boxes) - 1) // 8 + 1)
+        tiles = {}
+        for playing, icon in STATE_ICONS.items():
+            img = Image.new("1", self.device.size)
+            self.glyphs.blit(img, ICON_POS, icon)
+            buf = self.device.pack(img)
+            tiles[playing] = [buf[page * width + x:page * width + right] for page in pages]
+        return pages, x, tiles
+
     def load_tracks(self):
         """Load all music tracks from the music directory"""
         try:
-            with canvas(self.device) as draw:
+            with self.frame() as draw:
                 draw.text((10, 10), "Loading", font=self.font, fill="white")
                 draw.text((10, 40), "music files...", font=self.small_font, fill="white")
             
-            self.tracks = []
-            
-            # Find all music files with supported extensions
-            for extension in SUPPORTED_FORMATS:
-                pattern = os.path.join(MUSIC_DIR, f"*{extension}")
-                self.tracks.extend(glob.glob(pattern))
-            
-            # Sort tracks alphabetically
-            self.tracks.sort()
+            # Find all music files with supported extensions, sorted alphabetically
+            self.tracks = sorted(scan_music(MUSIC_DIR))
             
             if not self.tracks:
                 print("No music files found")
-                with canvas(self.device) as draw:
+                with self.frame() as draw:
                     draw.text((10, 10), "No music", font=self.font, fill="white")
                     draw.text((10, 40), f"Check: {MUSIC_DIR}", font=self.small_font, fill="white")
             else:
@@ -100,7 +198,7 @@ class MP3Player:
                 
         except Exception as e:
             print(f"Error loading tracks: {e}")
-            with canvas(self.device) as draw:
+            with self.frame() as draw:
                 draw.text((10, 10), "Error:", font=self.small_font, fill="white")
                 draw.text((10, 25), str(e)[:20], font=self.small_font, fill="white")
     
@@ -116,47 +214,82 @@ class MP3Player:
             index = len(self.tracks) - 1
         
         self.current_track_index = index
+        # A pending seek target belongs to the old track
+        self._seek_at = 0.0
         
         # Create a new Media object
-        media = self.vlc_instance.media_new(self.tracks[index])
+        path = self.tracks[index]
+        media = self.vlc_instance.media_new(path)
         
         # Set the media to the player
         self.player.set_media(media)
         
-        # Parse the media (this loads metadata)
-        media.parse()
-        
+        # Reading tags takes tens of ms on an SD card, so VLC parses in the
+        # background and the file name shows until it's done. Each track
+        # is parsed, and its title fitted, at most once per run.
+        name = self._titles.get(path)
+        self._pending = None
+        if name is None:
+            name = self._fit(os.path.basename(path))
+            media.event_manager().event_attach(vlc.EventType.MediaParsedChanged,
+                                              lambda _event: self.mark_dirty())
+            media.parse_with_options(vlc.MediaParseFlag.local, PARSE_TIMEOUT_MS)
+            self._pending = (media, path)
+        self._name = name
         return True
     
+    def _fit(self, name):
+        # The name only changes with the track, so it's fitted here rather
+        # than on every redraw
+        return fit_text(name, self.small_font, self.device.width - NAME_POS[0])
+    
+    def _resolve_title(self):
+        """Swap in the current track's tag title once VLC has parsed it"""
+        # Not done from VLC's parsed event: calling back into libvlc
+        # there can deadlock
+        with self.lock:
+            if self._pending is None:
+                return
+            media, path = self._pending
+            status = media.get_parsed_status()
+            if not status:
+                return
+            self._pending = None
+            # Finished either way, so nothing more to hear about
+            media.event_manager().event_detach(vlc.EventType.MediaParsedChanged)
+            if status != vlc.MediaParsedStatus.done:
+                # Failed or timed out, e.g. on a slow SD read: the file
+                # name stays up, and the next visit parses again
+                return
+            title = media.get_meta(vlc.Meta.Title)
+            self._name = self._titles[path] = self._fit(title or os.path.basename(path))
+    
     def play_pause(self):
         """Toggle between play and pause"""
         if not self.tracks:
             return
         
-        if self.player.is_playing():
+        # Use our own flag: libvlc's is_playing() is still False while a
+        # just-started track opens, so a quick second press would restart it
+        if self.is_playing:
             self.player.pause()
             self.is_playing = False
         else:
             self.player.play()
             self.is_playing = True
     
-    def get_track_name(self):
-        """Get the name of the current track"""
-        if not self.tracks or self.current_track_index >= len(self.tracks):
-            return "No track"
-        
-        # Get the track path
-        track_path = self.tracks[self.current_track_index]
-        
-        # Try to get metadata from VLC
-        media = self.player.get_media()
-        if media:
-            title = media.get_meta(vlc.Meta.Title)
-            if title:
-                return title
-        
-        # Fall back to filename if no metadata
-        return os.path.basename(track_path)
+    def seek(self, delta_ms):
+        """Move playback by delta_ms (VLC time is in milliseconds)"""
+        now = time.monotonic()
+        if now - self._seek_at < SEEK_CHAIN_S:
+            # libvlc keeps reporting the old time until a seek completes,
+            # so repeated presses add up from the last target instead
+            base = self._seek_target
+        else:
+            base = self.player.get_time()
+        target = max(base + delta_ms, 0)
+        self.player.set_time(target)
+        self._seek_target, self._seek_at = target, now
     
     def update_display(self):
         """Update the OLED display with current track info"""
@@ -165,47 +298,92 @@ class MP3Player:
             
             if total_tracks == 0:
                 # No tracks loaded
-                with canvas(self.device) as draw:
+                with self.frame() as draw:
                     draw.text((10, 10), "No tracks", font=self.font, fill="white")
                 return
             
-            # Get current track info (1-based for display)
-            current_track_num = self.current_track_index + 1
-            track_name = self.get_track_name()
+            self._resolve_title()
+            
+            # Current track info (1-based for display)
+            track_name = self._name
+            view = TrackView(self.current_track_index + 1, total_tracks,
+                             track_name, self.is_playing)
             
-            # Truncate track name if too long
-            if len(track_name) > 15:
-                track_name = track_name[:15] + "..."
+            # Nothing visible changed, so skip the redraw and the I2C write
+            prev = self._last_view
+            if view == prev:
+                return
+            
+            counter = f"{view.number}/{total_tracks}"
+            icon = STATE_ICONS[view.playing]
+            tiles = self.icon_tiles
+            if (tiles is not None and prev is not None
+                    and (prev.number, prev.total, prev.name) == (view.number, total_tracks, track_name)
+                    and COUNTER_POS[0] + self.font.getbbox(counter)[2] <= tiles[1]):
+                # Only the state flipped: copy its icon into the last frame
+                pages, x, tile = tiles[0], tiles[1], tiles[2][view.playing]
+                width = self.device.width
+                buf = bytearray(self._last_buf)
+                for page, data in zip(pages, tile):
+                    buf[page * width + x:page * width + x + len(data)] = data
+                buf = bytes(buf)
+                self.device.display_buffer(buf)
+                self._last_buf = buf
+                self._last_view = view
+                return
             
             # Draw on the display
-            with canvas(self.device) as draw:
-                # Draw track number / total tracks
-                draw.text((10, 10), f"{current_track_num}/{total_tracks}", font=self.font, fill="white")
+            glyphs = self.glyphs
+            with self.frame() as draw:
+                # Draw track number / total tracks and play/pause status
+                if glyphs is not None:
+                    glyphs.blit(self.canvas, COUNTER_POS, counter)
+                    glyphs.blit(self.canvas, ICON_POS, icon)
+                else:
+                    draw.text(COUNTER_POS, counter, font=self.font, fill="white")
+                    draw.text(ICON_POS, icon, font=self.font, fill="white")
                 
                 # Draw track name
-                draw.text((10, 40), track_name, font=self.small_font, fill="white")
-                
-                # Draw play/pause status
-                if self.is_playing:
-                    draw.text((100, 10), "▶", font=self.font, fill="white")
-                else:
-                    draw.text((100, 10), "⏸", font=self.font, fill="white")
+                draw.text(NAME_POS, track_name, font=self.small_font, fill="white")
+            self._last_view = view
         
         except Exception as e:
             print(f"Display update error: {e}")
-            with canvas(self.device) as draw:
+            with self.frame() as draw:
                 draw.text((10, 10), "Error:", font=self.small_font, fill="white")
                 draw.text((10, 25), str(e)[:20], font=self.small_font, fill="white")
     
+    def mark_dirty(self):
+        """Request a redraw from any thread"""
+        self.redraw.set()
+    
+    def _display_loop(self):
+        while True:
+            self.redraw.wait()
+            # Cleared before reading state, so a change made while we draw
+            # sets it again and gets its own frame
+            self.redraw.clear()
+            try:
+                with self.display_lock:
+                    self.update_display()
+            except Exception:
+                # Even the error frame failed, e.g. the I2C link dropped.
+                # Keep the thread alive and send everything next time,
+                # since what the panel holds is now unknown
+                logging.exception("Display thread error")
+                self._last_view = None
+                self._last_buf = None
+                self.device.resync()
+    
     def handle_play_pause(self):
         """Handle play/pause button press"""
         if not self.tracks:
-            with canvas(self.device) as draw:
-                draw.text((10, 10), "No tracks", font=self.font, fill="white")
+            # update_display shows "No tracks"
+            self.mark_dirty()
             return
         
         self.play_pause()
-        self.update_display()
+        self.mark_dirty()
     
     def handle_prev(self):
         """Handle previous track or rewind button press"""
@@ -214,16 +392,12 @@ class MP3Player:
         
         if self.is_playing:
             # If playing, rewind 15 seconds
-            current_time = self.player.get_time()
-            if current_time > 15000:  # VLC time is in milliseconds
-                self.player.set_time(current_time - 15000)
-            else:
-                self.player.set_time(0)
+            self.seek(-SEEK_STEP_MS)
         else:
             # If paused, go to previous track
             if self.current_track_index > 0:
                 self.set_track(self.current_track_index - 1)
-                self.update_display()
+                self.mark_dirty()
     
     def handle_next(self):
         """Handle next track or fast forward button press"""
@@ -232,74 +406,54 @@ class MP3Player:
         
         if self.is_playing:
             # If playing, fast forward 15 seconds
-            current_time = self.player.get_time()
-            self.player.set_time(current_time + 15000)
+            self.seek(SEEK_STEP_MS)
         else:
             # If paused, go to next track
             if self.current_track_index < len(self.tracks) - 1:
                 self.set_track(self.current_track_index + 1)
-                self.update_display()
+                self.mark_dirty()
     
-    def check_buttons(self):
-        """Check button states and handle presses"""
-        # Check play/pause button
-        current_play_pause_state = GPIO.input(PLAY_PAUSE_BTN)
-        if current_play_pause_state == 0 and self.last_play_pause_state == 1:
-            self.handle_play_pause()
-        self.last_play_pause_state = current_play_pause_state
-        
-        # Check previous button
-        current_prev_state = GPIO.input(PREV_BTN)
-        if current_prev_state == 0 and self.last_prev_state == 1:
-            self.handle_prev()
-        self.last_prev_state = current_prev_state
-        
-        # Check next button
-        current_next_state = GPIO.input(NEXT_BTN)
-        if current_next_state == 0 and self.last_next_state == 1:
-            self.handle_next()
-        self.last_next_state = current_next_state
+    def on_button(self, handler, pin):
+        """GPIO callback: run the pressed button's handler"""
+        with self.lock:
+            handler()
     
     def run(self):
         """Main loop to run the MP3 player"""
         try:
             print("MP3 Player running. Press Ctrl+C to exit.")
-            last_update_time = 0
-            
+            # Buttons arrive as GPIO callbacks and track ends as VLC events,
+            # so this loop sleeps until VLC says a track finished
             while True:
-                # Check and handle button presses
-                self.check_buttons()
-                
-                # Periodically update the display when playing
-                current_time = time.time()
-                if self.is_playing and current_time - last_update_time >= 5:
-                    self.update_display()
-                    last_update_time = current_time
-                
-                # Check if track ended and play next one
-                if self.is_playing and not self.player.is_playing():
+                self.track_ended.wait()
+                self.track_ended.clear()
+                with self.lock:
+                    if not self.is_playing:
+                        continue
                     print("Track ended")
                     # Move to next track if available
                     if self.current_track_index < len(self.tracks) - 1:
                         self.set_track(self.current_track_index + 1)
                         self.player.play()
-                        self.update_display()
                     else:
                         # At the end of the playlist
                         self.is_playing = False
-                        self.update_display()
-                
-                # Small delay to prevent CPU hogging
-                time.sleep(0.1)
+                    self.mark_dirty()
                     
         except KeyboardInterrupt:
             print("Exiting...")
         finally:
             # Clean up
-            GPIO.cleanup()
+            self.buttons.close()
             self.player.stop()
-            self.device.clear()
+            with self.display_lock:
+                self.device.clear()
 
 if __name__ == "__main__":
+    # The OLED driver reports the I2C clock through logging; LOGLEVEL=DEBUG for more
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
     player = MP3Player()
     player.run()
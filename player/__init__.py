@@ -0,0 +1,8 @@
+"""Shared code for the Rpi-mp3 player scripts.
+
+core     MPD control, button handling and the main loop
+display  OLED screen layouts for the MPD scripts
+gpio     button inputs via lgpio or RPi.GPIO
+oled     SSD1306 transport that only sends changed pages
+sched    real-time priority for the GPIO callback thread
+"""
@@ -0,0 +1,470 @@
+"""MPD control, button handling and the main loop shared by the MPD scripts
+
+Each mainprogram*.py supplies a Config and a screen class from
+player.display and calls run().
+"""
+import os
+import time
+import logging
+import threading
+import select
+import socket
+import queue
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, field, replace
+from mpd import MPDClient, ConnectionError as MPDConnectionError
+from player.gpio import Buttons
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Config:
+    """Per-script settings; the defaults are what every script shares"""
+    buttons: dict                   # action -> pin, numbered per pin_mode
+    pin_mode: str = 'BOARD'         # 'BOARD' or 'BCM'
+    font_path: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+    display: dict = field(default_factory=dict)  # font sizes and padding for the screen
+    music_dir: str = os.path.expanduser("~/music")
+    playlist_name: str = None       # save the startup queue under this name
+    mpd_host: str = "localhost"
+    mpd_port: int = 6600
+    keepalive_idle: int = 30        # idle seconds before TCP checks the MPD link is alive
+    i2c_address: int = 0x3C
+    debounce_ms: int = 300
+    settle_ms: int = 5              # a press must hold the pin low this long to count
+    event_queue_size: int = 8       # pending button presses; extras are dropped
+    coalesce_ms: int = 100          # repeats of one button inside this window count once
+    snapshot_ttl: float = 1.0       # seconds a paused/stopped snapshot is reused
+    playing_ttl: float = 10.0       # while playing, elapsed is extrapolated; resync this often
+    status_timeout: float = 1.0     # a redraw gives up on MPD's status reply after this long
+
+@dataclass
+class SongState:
+    """Player state parsed once per snapshot"""
+    __slots__ = ('state', 'pos', 'total', 'elapsed', 'duration', 'title', 'artist')
+    state: str
+    pos: int
+    total: int
+    elapsed: float
+    duration: float
+    title: str
+    artist: str
+
+RETRY_MIN = 1    # first idle-watcher reconnect delay, seconds
+RETRY_MAX = 30   # the delay doubles after each failure up to this
+
+def tune_socket(client, idle):
+    """Send commands without Nagle delay and have TCP probe a quiet link"""
+    sock = client._sock
+    if sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return  # unix socket: nothing to tune
+    # Short command lines would otherwise wait on the previous reply's ACK
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+
+class MPDController:
+    def __init__(self, config, with_song=False):
+        self.config = config
+        self.with_song = with_song  # also fetch currentsong for title/artist
+        self.client = MPDClient()
+        self.client.timeout = 10
+        self._lock = threading.Lock()
+        self._stale = False
+        self._snap = None
+        self._snap_ts = 0.0
+        self._snap_ttl = 0.0
+        self._idle_thread = None
+        # Song metadata for the whole queue as parallel lists, indexed by
+        # position; reloaded only when MPD's playlist version moves on
+        self._playlist_version = None
+        self._titles = []
+        self._artists = []
+        self._times = []
+
+    @contextmanager
+    def _exchange(self):
+        """Hold the command client for one exchange, reopening it if MPD dropped us"""
+        with self._lock:
+            if self._stale:
+                self._reconnect()
+            try:
+                yield self.client
+            except (MPDConnectionError, ConnectionError):
+                self._stale = True
+                raise
+
+    def snapshot(self):
+        """Return the player state, reusing it briefly; commands and idle events invalidate it"""
+        snap = self._snap
+        if snap is not None:
+            age = time.monotonic() - self._snap_ts
+            if age < self._snap_ttl:
+                if snap.state == 'play':
+                    # Seeks, pauses and track changes all raise a 'player'
+                    # event, so until one arrives elapsed just follows the clock
+                    return replace(snap, elapsed=min(snap.elapsed + age, snap.duration))
+                return snap
+        with self._exchange() as c:
+            # The socket timeout is long enough for slow commands, so a
+            # silently dead link would stall the screen for all of it.
+            # A late reply would be read as the next answer, so give
+            # up on the connection, not just this call.
+            c.send_status()
+            if not select.select([c], [], [], self.config.status_timeout)[0]:
+                raise MPDConnectionError("MPD didn't answer status in time")
+            return self._store(c, c.fetch_status())
+
+    def command(self, name, *args):
+        """Send one player command and read the new state in the same round trip"""
+        with self._exchange() as c:
+            try:
+                c.command_list_ok_begin()
+                getattr(c, name)(*args)
+                c.status()
+                status = c.command_list_end()[-1]
+            except Exception:
+                self._snap = None
+                raise
+            # The redraw that follows a press reuses this instead of asking again
+            return self._store(c, status)
+
+    def _store(self, c, status):
+        pos = int(status.get('song', 0))
+        title, artist, length = 'Unknown', '', 0
+        if self.with_song:
+            if status.get('playlist') != self._playlist_version:
+                self._load_playlist(c, status.get('playlist'))
+            if pos < len(self._titles):
+                title, artist, length = self._titles[pos], self._artists[pos], self._times[pos]
+        snap = SongState(
+            state=status.get('state', 'stop'),
+            pos=pos,
+            total=int(status.get('playlistlength', 0)),
+            elapsed=float(status.get('elapsed', 0)),
+            duration=float(status.get('duration', length)),
+            title=title,
+            artist=artist,
+        )
+        # A playing snapshot stays valid too: only its elapsed needs adjusting
+        playing = snap.state == 'play'
+        self._snap_ttl = self.config.playing_ttl if playing else self.config.snapshot_ttl
+        self._snap, self._snap_ts = snap, time.monotonic()
+        return snap
+
+    def _load_playlist(self, c, version):
+        songs = c.playlistinfo()
+        self._titles = [song.get('title', 'Unknown') for song in songs]
+        self._artists = [song.get('artist', '') for song in songs]
+        self._times = [song.get('time', 0) for song in songs]
+        self._playlist_version = version
+        logger.debug("Cached metadata for %d queued songs", len(songs))
+
+    def _reconnect(self):
+        logger.warning("MPD connection lost, reconnecting")
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        self.connect()
+        self._stale = False
+
+    def close(self):
+        # Either call can fail if the link is already dead; neither matters at exit
+        with suppress(Exception):
+            self.client.close()
+        with suppress(Exception):
+            self.client.disconnect()
+
+    def connect(self):
+        try:
+            self.client.connect(self.config.mpd_host, self.config.mpd_port)
+            tune_socket(self.client, self.config.keepalive_idle)
+            logger.info("Connected to MPD server")
+        except Exception as e:
+            logger.error(f"MPD connection failed: {e}")
+            raise
+
+    def start_idle_watcher(self, on_change):
+        """Call on_change whenever MPD reports a player/playlist event"""
+        self._idle_stop_r, self._idle_stop_w = os.pipe()
+        self._idle_thread = threading.Thread(target=self._idle_loop, args=(on_change,), daemon=True)
+        self._idle_thread.start()
+
+    def stop_idle_watcher(self):
+        """Break the watcher out of idle with noidle and close its connection"""
+        if self._idle_thread is None:
+            return
+        os.write(self._idle_stop_w, b'x')
+        self._idle_thread.join(timeout=2)
+        self._idle_thread = None
+
+    def invalidate(self):
+        """Drop the cached snapshot after MPD reported a change
+
+        Taken under the command lock, so it always lands after a status
+        reply that was already in flight. Otherwise that reply, sent
+        before the change, would be cached after it.
+        """
+        with self._lock:
+            self._snap = None
+
+    def _idle_loop(self, on_change):
+        # idle blocks its connection, so it can't share the command client
+        config = self.config
+        client = MPDClient()
+        client.idletimeout = None
+        stop = self._idle_stop_r
+        delay = RETRY_MIN
+        try:
+            while True:
+                try:
+                    client.connect(config.mpd_host, config.mpd_port)
+                    tune_socket(client, config.keepalive_idle)
+                    delay = RETRY_MIN
+                    # Changes made while we were disconnected raised no event
+                    self.invalidate()
+                    on_change(())
+                    while True:
+                        client.send_idle('player', 'playlist')
+                        ready, _, _ = select.select([client, stop], [], [])
+                        if stop in ready:
+                            client.noidle()
+                            return
+                        changes = client.fetch_idle()
+                        self.invalidate()
+                        on_change(changes)
+                except Exception as e:
+                    logger.error(f"MPD idle watcher error: {e}")
+                    try:
+                        client.disconnect()
+                    except Exception:
+                        pass
+                    # Back off while MPD stays away, unless we're shutting down
+                    if select.select([stop], [], [], delay)[0]:
+                        return
+                    delay = min(delay * 2, RETRY_MAX)
+        finally:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    def wait_for_update(self, status=None):
+        # Block on MPD's 'update' event instead of polling; MPD queues idle
+        # events per client, so a scan that ends between the status check
+        # and the idle is still reported
+        if status is None:
+            status = self.client.status()
+        while 'updating_db' in status:
+            logger.debug("Database update in progress...")
+            self.client.send_idle('update')
+            self.client.fetch_idle()
+            status = self.client.status()
+
+    def init_playlist(self):
+        """Rescan the library, queue all of it and cue the first track paused"""
+        music_dir = self.config.music_dir
+        name = self.config.playlist_name
+        try:
+            if not os.path.isdir(music_dir):
+                raise FileNotFoundError(f"Music directory not found: {music_dir}")
+
+            # Start the rescan and read back everything the next steps need
+            # in one round-trip
+            logger.debug("Updating database for %s", music_dir)
+            self.client.command_list_ok_begin()
+            self.client.stats()
+            self.client.update()
+            self.client.listplaylists()
+            self.client.status()
+            before, _, stored, status = self.client.command_list_end()
+            self.wait_for_update(status)
+            after = self.client.stats()
+
+            playlists = [p['playlist'] for p in stored]
+            # MPD only moves db_update when a scan changed something, so a
+            # queue left over from the last run that holds the whole
+            # library is still correct
+            current = (after.get('db_update') == before.get('db_update')
+                       and status.get('playlistlength') == after.get('songs'))
+            if current:
+                logger.debug("Library unchanged, keeping the queue")
+
+            # Queue the whole library, save it and cue the first track in one
+            # round-trip; MPD walks its own database, so nothing is scanned here
+            self.client.command_list_ok_begin()
+            if not current:
+                self.client.clear()
+                self.client.add("/")  # Add root of MPD's music directory
+            if name and not (current and name in playlists):
+                if name in playlists:
+                    self.client.rm(name)
+                self.client.save(name)
+            self.client.play(0)
+            self.client.pause()
+            self.client.command_list_end()
+            logger.info("Playback initialized successfully")
+
+        except Exception as e:
+            logger.error(f"Playlist initialization failed: {e}")
+            raise
+
+class ButtonHandler:
+    def __init__(self, config, mpd, screen, buttons):
+        self.config = config
+        self.mpd = mpd
+        self.screen = screen
+        self.buttons = buttons
+        self.last_press = {pin: 0.0 for pin in config.buttons.values()}
+        self.dirty = True
+        self.deadline = None  # monotonic time the screen next wants redrawing on its own
+        self.wake = threading.Event()
+        self.events = queue.Queue(maxsize=config.event_queue_size)
+        self.actions = {
+            'play': self.handle_playpause,
+            'prev': lambda: self.handle_skip('prev'),
+            'next': lambda: self.handle_skip('next'),
+        }
+
+    def on_press(self, action, channel):
+        """GPIO callback: debounce and enqueue only, the worker does the I/O"""
+        if self._debounce(channel): return
+        try:
+            self.events.put_nowait((action, time.monotonic()))
+        except queue.Full:
+            logger.warning("Button queue full, dropping '%s'", action)
+
+    def start_worker(self):
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        window = self.config.coalesce_ms / 1000
+        last_action, last_ts = None, 0.0
+        while True:
+            action, ts = self.events.get()
+            if action == last_action and ts - last_ts < window:
+                continue
+            last_action, last_ts = action, ts
+            self.actions[action]()
+            self.mark_dirty()
+
+    def handle_playpause(self):
+        try:
+            snap = self.mpd.snapshot()
+            if snap.state == 'play':
+                self.mpd.command('pause', 1)
+                logger.debug("Paused playback")
+            else:
+                self.mpd.command('play')
+                logger.debug("Started playback")
+        except Exception as e:
+            logger.error(f"Play/pause error: {e}")
+
+    def handle_skip(self, direction):
+        try:
+            snap = self.mpd.snapshot()
+            if direction == 'next':
+                if snap.pos < snap.total - 1:
+                    self.mpd.command('next')
+                    logger.debug("Next track")
+                else:
+                    logger.debug("End of playlist")
+            elif direction == 'prev':
+                if snap.pos > 0:
+                    self.mpd.command('previous')
+                    logger.debug("Previous track")
+        except Exception as e:
+            logger.error(f"Skip error: {e}")
+
+    def _debounce(self, pin):
+        # Buttons has already dropped glitches, so they never start the
+        # window. It is per pin, so a 'next' press never swallows a
+        # quick 'prev'.
+        now = time.monotonic()
+        if (now - self.last_press[pin]) < (self.config.debounce_ms / 1000):
+            return True
+        self.last_press[pin] = now
+        return False
+
+    def mark_dirty(self, changes=None):
+        """Request a redraw from any thread
+
+        Only the main loop renders, so I2C access is never concurrent. The
+        Event acts as a one-slot queue: requests made before it wakes
+        collapse into a single redraw.
+        """
+        self.dirty = True
+        self.wake.set()
+
+    def refresh(self):
+        """Block until something marks the display dirty or the screen's deadline passes, then redraw"""
+        deadline = self.deadline
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        self.wake.wait(timeout)
+        self.wake.clear()
+        if self.dirty or deadline is not None:
+            # Cleared before the snapshot is taken, so a request made while
+            # this frame draws sets it again and gets a frame of its own
+            self.dirty = False
+            self.update_display()
+
+    def update_display(self):
+        try:
+            # Count the tick from the snapshot, so render and I2C time
+            # don't push every progress step later
+            start = time.monotonic()
+            tick = self.screen.show(self.mpd.snapshot())
+            self.deadline = None if tick is None else start + tick
+        except Exception as e:
+            # Panel state is unknown now, so don't skip the next frame
+            self.screen.invalidate()
+            self.dirty = True
+            # Retry after a pause: the old deadline has already passed, and
+            # while MPD is down every attempt fails straight away
+            self.deadline = time.monotonic() + RETRY_MIN
+            logger.error(f"Display update failed: {e}")
+
+def setup_buttons(config, handler):
+    for action, pin in config.buttons.items():
+        handler.buttons.watch(pin, lambda ch, action=action: handler.on_press(action, ch),
+                              config.debounce_ms, config.settle_ms)
+
+def run(config, screen_cls):
+    """Run a player until Ctrl+C: MPD playback drawn by screen_cls"""
+    # LOGLEVEL=DEBUG for verbose output
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    mpd = MPDController(config, with_song=screen_cls.needs_song)
+    buttons = Buttons(config.pin_mode)
+    try:
+        screen = screen_cls(config)
+        # The rescan can take a while on a big library, so say so first
+        screen.splash("Loading", "music library...")
+        mpd.connect()
+        mpd.init_playlist()
+        screen.prepare(mpd.snapshot())
+
+        handler = ButtonHandler(config, mpd, screen, buttons)
+        setup_buttons(config, handler)
+        handler.start_worker()
+        mpd.start_idle_watcher(handler.mark_dirty)
+        logger.info("System ready. Starting main loop...")
+
+        # Main loop: sleeps until MPD, a button or the screen's tick wakes it
+        handler.mark_dirty()
+        while True:
+            handler.refresh()
+
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    except Exception as e:
+        logger.critical(f"Fatal error: {e}", exc_info=True)
+    finally:
+        buttons.close()
+        mpd.stop_idle_watcher()
+        mpd.close()
+        logger.info("Cleanup complete")
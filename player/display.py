@@ -0,0 +1,283 @@
+"""OLED screens for the MPD scripts
+
+A screen turns a SongState into pixels. show() returns how many seconds
+until it wants to be redrawn on its own, or None to wait for the next
+MPD or button event.
+"""
+import logging
+from PIL import Image, ImageDraw, ImageFont
+from player.oled import BulkI2C, FastSSD1306
+
+logger = logging.getLogger(__name__)
+
+STATE_ICONS = {'play': "▶", 'pause': "⏸"}
+FRAME_CACHE_SIZE = 512  # pre-rendered frames kept in memory (1 KB each)
+MIN_TICK = 0.05         # shortest sleep between progress-bar redraws while playing
+FIT_CACHE_SIZE = 64     # fitted title/artist strings remembered
+ELLIPSIS = "…"
+
+def fit_text(text, font, max_w):
+    """Cut text to at most max_w pixels, marking the cut with an ellipsis"""
+    if font.getlength(text) <= max_w:
+        return text
+    # Longest prefix that still fits together with the ellipsis
+    lo, hi = 0, len(text) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if font.getlength(text[:mid] + ELLIPSIS) <= max_w:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + ELLIPSIS
+
+class GlyphCache:
+    """Characters of one font rasterised once, then pasted instead of drawn"""
+
+    def __init__(self, font, chars=""):
+        self.font = font
+        self.glyphs = {}
+        for char in chars:
+            self.glyph(char)
+
+    def glyph(self, char):
+        """Return (bitmap, advance) for one character, rasterising it only once"""
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            font = self.font
+            _, _, right, bottom = font.getbbox(char)
+            bitmap = None
+            if right > 0 and bottom > 0:
+                bitmap = Image.new("1", (right, bottom))
+                ImageDraw.Draw(bitmap).text((0, 0), char, font=font, fill=255)
+            glyph = self.glyphs[char] = (bitmap, font.getlength(char))
+        return glyph
+
+    def blit(self, img, xy, text):
+        """Paste cached glyph bitmaps; same pixels as draw.text for DejaVu digits and icons"""
+        x, y = xy
+        pen = 0.0
+        for char in text:
+            bitmap, advance = self.glyph(char)
+            if bitmap is not None:
+                img.paste(255, (x + round(pen), y), bitmap)
+            pen += advance
+
+class DisplayManager:
+    """Panel, reused canvas and fonts; subclasses lay out the screen"""
+    needs_song = False  # whether show() reads title/artist
+    message_font = None  # font for splash(); PIL's built-in one if unset
+
+    def __init__(self, config):
+        self.config = config
+        self.serial = BulkI2C(port=1, address=config.i2c_address)
+        self.device = FastSSD1306(self.serial)
+        # Geometry is fixed; plain attributes avoid luma's property lookups
+        self.width, self.height = self.device.width, self.device.height
+        self.size = (self.width, self.height)
+        # One canvas reused for every render; cleared instead of reallocated
+        self.canvas = Image.new("1", self.size)
+        self.canvas_draw = ImageDraw.Draw(self.canvas)
+        self.last_key = None   # inputs of the frame currently on the panel
+
+    def font(self, size_key):
+        return ImageFont.truetype(self.config.font_path, self.config.display[size_key])
+
+    def splash(self, *lines):
+        """Show a few lines of text, e.g. while MPD rescans at startup"""
+        font = self.message_font or ImageFont.load_default()
+        pad = self.config.display['padding']
+        self.canvas_draw.rectangle((0, 0) + self.size, fill=0)
+        y = pad
+        for line in lines:
+            self.canvas_draw.text((pad, y), line, font=font, fill=255)
+            y += font.getbbox(line)[3] + pad
+        self.device.display(self.canvas)
+        # The canvas no longer holds a track frame
+        self.invalidate()
+
+    def prepare(self, snap):
+        """Called once at startup with the first snapshot"""
+
+    def invalidate(self):
+        """Forget what is on the panel, e.g. after a failed write"""
+        self.last_key = None
+
+    def show(self, snap):
+        raise NotImplementedError
+
+class TrackNumberDisplay(DisplayManager):
+    """Large track number, 'n / total' and the play state"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.fonts = {
+            'main': self.font('main_font_size'),
+            'meta': self.font('meta_font_size'),
+        }
+        self.frame_cache = {}
+        self.text_sizes = {}
+        self.glyphs = {
+            'main': GlyphCache(self.fonts['main'], "0123456789"),
+            'meta': GlyphCache(self.fonts['meta'], "0123456789 /" + "".join(STATE_ICONS.values())),
+        }
+        self.message_font = self.fonts['meta']
+        for icon in STATE_ICONS.values():
+            self._measure(icon, 'meta')
+        logger.info("OLED display initialized")
+
+    def _blit_text(self, img, xy, text, font):
+        self.glyphs[font].blit(img, xy, text)
+
+    def _measure(self, text, font):
+        """Return the (width, height) of text, measuring each string only once"""
+        key = (text, font)
+        size = self.text_sizes.get(key)
+        if size is None:
+            bbox = self.fonts[font].getbbox(text)
+            size = self.text_sizes[key] = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+        return size
+
+    def prepare(self, snap):
+        self.prerender(snap.total)
+
+    def prerender(self, total_tracks):
+        """Render every (track, state) frame once so updates are just lookups"""
+        for pos in range(min(total_tracks, FRAME_CACHE_SIZE // 2)):
+            for state in ("play", "pause"):
+                self._cached_frame((pos, total_tracks, state))
+        logger.debug("Pre-rendered %d frames", len(self.frame_cache))
+
+    def show(self, snap):
+        frame = self.create_frame(snap.pos, snap.total, snap.state)
+        if frame is not None:
+            self.device.display_buffer(frame)
+        return None
+
+    def create_frame(self, current_pos, total_tracks, state):
+        """Return the frame as SSD1306 page bytes, or None if it is already shown"""
+        state = "play" if state == "play" else "pause"
+        key = (current_pos, total_tracks, state)
+        if key == self.last_key:
+            return None
+        self.last_key = key
+        return self._cached_frame(key)
+
+    def _cached_frame(self, key):
+        # PIL only runs on a cache miss
+        buf = self.frame_cache.get(key)
+        if buf is None:
+            buf = self.device.pack(self._render_frame(*key))
+            if len(self.frame_cache) < FRAME_CACHE_SIZE:
+                self.frame_cache[key] = buf
+        return buf
+
+    def _render_frame(self, current_pos, total_tracks, state):
+        W, H = self.width, self.height
+        pad = self.config.display['padding']
+        measure, blit = self._measure, self._blit_text
+        img = self.canvas
+        self.canvas_draw.rectangle((0, 0, W, H), fill=0)
+
+        # Main track number
+        track_no = current_pos + 1
+        main_text = f"{track_no}"
+        w, h = measure(main_text, 'main')
+        x = (W - w) // 2
+        y = (H - h) // 3
+        blit(img, (x, y), main_text, 'main')
+
+        # Track counter
+        counter_text = f"{track_no} / {total_tracks}"
+        w, h = measure(counter_text, 'meta')
+        x = (W - w) // 2
+        y = H - h - pad
+        blit(img, (x, y), counter_text, 'meta')
+
+        # Play state
+        state_icon = STATE_ICONS[state]
+        w, _ = measure(state_icon, 'meta')
+        x = W - w - pad
+        blit(img, (x, pad), state_icon, 'meta')
+
+        return img
+
+class NowPlayingDisplay(DisplayManager):
+    """Title, artist, play state and a progress bar"""
+    needs_song = True
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.title_font = self.font('title_font_size')
+        self.info_font = self.font('info_font_size')
+        self.message_font = self.info_font
+        # Icons never change, so measure and rasterise them once
+        self.icon_sizes = {icon: self.info_font.getbbox(icon)[2:] for icon in STATE_ICONS.values()}
+        self.icons = GlyphCache(self.info_font, "".join(STATE_ICONS.values()))
+        pad = config.display['padding']
+        self.bar_w = self.width - 2 * pad
+        # The title shares its line with the icon; the artist has the full width
+        self.title_w = self.width - 3 * pad - max(w for w, _ in self.icon_sizes.values())
+        self.artist_w = self.bar_w
+        self.fitted = {}
+        logger.info("OLED initialized")
+
+    def fit(self, text, font, max_w):
+        """fit_text(), remembering the result for titles seen recently"""
+        key = (text, font)
+        fitted = self.fitted.get(key)
+        if fitted is None:
+            fitted = fit_text(text, font, max_w)
+            if len(self.fitted) >= FIT_CACHE_SIZE:
+                self.fitted.clear()
+            self.fitted[key] = fitted
+        return fitted
+
+    def fill_px(self, snap):
+        """Filled width of the progress bar in whole pixels"""
+        return int(snap.elapsed * self.bar_w / snap.duration) if snap.duration > 0 else 0
+
+    def show(self, snap):
+        filled = self.fill_px(snap)
+        self.render(snap, filled)
+        # Wake again when the progress bar is due to gain a pixel
+        if snap.state == 'play' and snap.duration > 0:
+            next_px = (filled + 1) * snap.duration / self.bar_w
+            return max(next_px - snap.elapsed, MIN_TICK)
+        return None
+
+    def render(self, snap, filled):
+        w, h = self.size
+        pad = self.config.display['padding']
+        bar_w = self.bar_w
+        title = self.fit(snap.title, self.title_font, self.title_w)
+        artist = self.fit(snap.artist, self.info_font, self.artist_w)
+        icon = STATE_ICONS['play' if snap.state == 'play' else 'pause']
+
+        # Progress is compared in whole pixels, so most ticks change nothing
+        key = (title, artist, icon, filled)
+        prev = self.last_key
+        if key == prev:
+            return
+        self.last_key = key
+
+        title_font, info_font = self.title_font, self.info_font
+        img, draw = self.canvas, self.canvas_draw
+        # The canvas still holds the last frame, so when only the bar grew
+        # the text is left as it is and just the bar is drawn again
+        if prev is None or prev[:3] != key[:3]:
+            draw.rectangle((0, 0, w, h), fill=0)
+
+            # Draw track info
+            draw.text((pad, pad), title, font=title_font, fill=255)
+            draw.text((pad, pad + self.config.display['title_font_size'] + 2), artist, font=info_font, fill=255)
+
+            # Draw state icon
+            tw, th = self.icon_sizes[icon]
+            self.icons.blit(img, (w - tw - pad, pad), icon)
+
+        # Draw progress bar
+        y_bar = h - pad - 4
+        draw.rectangle([pad, y_bar, pad + bar_w, y_bar + 4], outline=255, fill=0)
+        draw.rectangle([pad, y_bar, pad + filled, y_bar + 4], outline=255, fill=255)
+
+        self.device.display(img)
@@ -0,0 +1,95 @@
+"""Button inputs through lgpio, or RPi.GPIO where lgpio isn't installed
+
+lgpio talks to /dev/gpiochipN, so it works for members of the 'gpio'
+group without root and on boards RPi.GPIO no longer supports. It only
+knows BCM numbers; BOARD pins are translated here, so callers keep the
+numbering their scripts were written with.
+"""
+import time
+
+from player.sched import boost_current_thread
+
+try:
+    import lgpio
+except ImportError:
+    lgpio = None
+    import RPi.GPIO as GPIO
+
+GPIO_CHIP = 0
+# 40-pin header position -> BCM line
+BOARD_TO_BCM = {
+    3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22,
+    16: 23, 18: 24, 19: 10, 21: 9, 22: 25, 23: 11, 24: 8, 26: 7, 27: 0,
+    28: 1, 29: 5, 31: 6, 32: 12, 33: 13, 35: 19, 36: 16, 37: 26, 38: 20,
+    40: 21,
+}
+
+class Buttons:
+    """Pull-up inputs that call back with the pin number when pressed
+
+    A press only counts once the pin has stayed low for settle_ms, so
+    noise spikes never reach the callback. Like RPi.GPIO's bouncetime,
+    presses within bouncetime_ms of the last reported one are dropped.
+    Both libraries run every callback on one thread of their own, which
+    is moved to real-time priority on the first edge.
+    """
+
+    def __init__(self, pin_mode='BCM'):
+        self.pin_mode = pin_mode
+        self.callbacks = []  # lgpio drops callbacks that aren't referenced
+        self._boosted = False
+        if lgpio is not None:
+            self.handle = lgpio.gpiochip_open(GPIO_CHIP)
+        else:
+            GPIO.setmode(getattr(GPIO, pin_mode))
+
+    def _line(self, pin):
+        return BOARD_TO_BCM[pin] if self.pin_mode == 'BOARD' else pin
+
+    def _boost(self):
+        # Started in C, so the thread can only be reached from inside a callback
+        if not self._boosted:
+            self._boosted = True
+            boost_current_thread()
+
+    def watch(self, pin, callback, bouncetime_ms, settle_ms=0):
+        if lgpio is None:
+            def on_edge(channel):
+                self._boost()
+                # No filter in RPi.GPIO: re-read once the contacts settled
+                time.sleep(settle_ms / 1000)
+                if GPIO.input(channel) == GPIO.LOW:
+                    callback(channel)
+
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            GPIO.add_event_detect(pin, GPIO.FALLING, callback=on_edge,
+                                  bouncetime=bouncetime_ms)
+            return
+        line = self._line(pin)
+        lgpio.gpio_claim_alert(self.handle, line, lgpio.FALLING_EDGE, lgpio.SET_PULL_UP)
+        if settle_ms:
+            # Filtered below Python: only levels held this long raise an
+            # alert, so the callback thread never sleeps to check
+            lgpio.gpio_set_debounce_micros(self.handle, line, settle_ms * 1000)
+        bounce_ns = bouncetime_ms * 1_000_000
+        last = [-bounce_ns]
+
+        def on_alert(chip, gpio, level, tick):
+            self._boost()
+            # tick is the kernel's edge timestamp in ns, not our wake-up time
+            if tick - last[0] < bounce_ns:
+                return
+            last[0] = tick
+            callback(pin)
+
+        self.callbacks.append(lgpio.callback(self.handle, line, lgpio.FALLING_EDGE, on_alert))
+
+    def close(self):
+        if lgpio is None:
+            GPIO.cleanup()
+            return
+        for cb in self.callbacks:
+            cb.cancel()
+        self.callbacks.clear()
+        # Closing the chip releases every line claimed through it
+        lgpio.gpiochip_close(self.handle)
@@ -0,0 +1,174 @@
+"""SSD1306 transport helpers shared by the player scripts.
+
+For the fastest refresh also raise the I2C clock in /boot/config.txt:
+    dtparam=i2c_arm=on,i2c_arm_baudrate=1000000
+"""
+import logging
+from PIL import Image
+from smbus2 import i2c_msg
+from luma.core.interface.serial import i2c
+from luma.oled.device import ssd1306
+
+DATA_MODE = 0x40        # SSD1306 control byte: following bytes are GDDRAM data
+DATA_PREFIX = bytes([DATA_MODE])
+MAX_TRANSFER = 4096     # per message; well under i2c-dev's 8192-byte cap
+MIN_I2C_HZ = 400000     # below this the bus, not the code, limits refresh rate
+SCROLL_LEFT = 0x27      # continuous horizontal scroll setup
+SCROLL_STOP = 0x2E
+SCROLL_START = 0x2F
+SCROLL_5_FRAMES = 0x00  # step interval code: one pixel every 5 panel frames
+# The same device-tree node, reached through either sysfs class
+CLOCK_PATHS = (
+    "/sys/class/i2c-adapter/i2c-{port}/of_node/clock-frequency",
+    "/sys/class/i2c-dev/i2c-{port}/device/of_node/clock-frequency",
+)
+
+logger = logging.getLogger(__name__)
+
+def i2c_clock_hz(port=1):
+    """Return the bus clock from the device tree, or None if it isn't exposed"""
+    for path in CLOCK_PATHS:
+        try:
+            with open(path.format(port=port), 'rb') as f:
+                # Device-tree cells are big-endian u32s, not text
+                return int.from_bytes(f.read(4), 'big')
+        except OSError:
+            continue
+    return None
+
+class BulkI2C(i2c):
+    """luma i2c serial that sends a whole data payload in one I2C transaction
+
+    luma falls back to 32-byte SMBus block writes, each with its own
+    START/address/control byte. A full 128x64 frame therefore costs 32
+    transactions instead of one.
+    """
+
+    def __init__(self, port=1, address=0x3C, **kwargs):
+        super().__init__(port=port, address=address, **kwargs)
+        hz = i2c_clock_hz(port)
+        if hz is None:
+            logger.debug("I2C bus %d clock not exposed in sysfs", port)
+        elif hz < MIN_I2C_HZ:
+            logger.warning("I2C bus %d runs at %d kHz; add "
+                           "'dtparam=i2c_arm_baudrate=1000000' to /boot/config.txt",
+                           port, hz // 1000)
+        else:
+            logger.info("I2C bus %d at %d kHz", port, hz // 1000)
+
+    def data(self, data):
+        # FastSSD1306 hands over bytes; luma's own paths may still pass lists
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data)
+        for i in range(0, len(data), MAX_TRANSFER):
+            self._bus.i2c_rdwr(i2c_msg.write(self._addr, DATA_PREFIX + data[i:i + MAX_TRANSFER]))
+
+class FastSSD1306(ssd1306):
+    """ssd1306 that only transmits the part of the panel that changed
+
+    The last frame sent is kept in SSD1306 page order. Each new frame is
+    compared with it page by page, and only the rectangle of pages and
+    columns that covers every change is sent.
+    """
+    # Class defaults: luma's constructor already clears the panel via display()
+    _prev_buf = None
+    _window = None  # (first_page, last_page, first_col, last_col) the panel is addressed to
+    _scrolling = False
+
+    def pack(self, image):
+        """Convert a 1-bit image into SSD1306 page order (LSB = top pixel)
+
+        Gives the same bytes as numpy's packbits(bitorder='little') over
+        each 8-row page, without needing numpy on the Pi.
+        """
+        # Rotating clockwise turns each column into a row of packed bytes,
+        # with the bottom page first; slicing re-orders them page by page.
+        raw = self.preprocess(image).transpose(Image.ROTATE_270).tobytes()
+        pages = self._pages
+        return b''.join(raw[pages - 1 - page::pages] for page in range(pages))
+
+    def display(self, image):
+        assert(image.mode == self.mode)
+        assert(image.size == self.size)
+        self.display_buffer(self.pack(image))
+
+    def display_buffer(self, buf):
+        """Send a frame that is already in page order, e.g. one cached from pack()"""
+        prev = self._prev_buf
+        width = self._w
+        if prev is None:
+            first, last, lo, hi = 0, self._pages - 1, 0, width - 1
+        elif buf == prev:
+            # One memcmp settles the common case before any per-page slicing
+            return
+        elif self._scrolling:
+            # RAM can't be written mid-scroll, and stopping leaves it stale
+            self.stop_scroll()
+            return self.display_buffer(buf)
+        else:
+            first = last = None
+            lo, hi = width, -1
+            for page in range(self._pages):
+                start = page * width
+                # XOR the page as one big integer: the lowest and highest set
+                # bits give the first and last changed column, all in C
+                diff = (int.from_bytes(buf[start:start + width], 'little')
+                        ^ int.from_bytes(prev[start:start + width], 'little'))
+                if diff:
+                    if first is None:
+                        first = page
+                    last = page
+                    lo = min(lo, ((diff & -diff).bit_length() - 1) >> 3)
+                    hi = max(hi, (diff.bit_length() - 1) >> 3)
+        # One window covering every change: two transactions per frame at
+        # most, even if a few unchanged bytes ride along inside it
+        if lo == 0 and hi == width - 1:
+            data = buf[first * width:(last + 1) * width]
+        else:
+            data = b''.join(buf[page * width + lo:page * width + hi + 1]
+                            for page in range(first, last + 1))
+        self._send_window((first, last, lo, hi), data)
+        self._prev_buf = buf
+
+    def start_scroll(self, first_page, last_page):
+        """Have the panel rotate pages first..last leftwards by itself
+
+        No I2C traffic is needed while it runs. The next frame that
+        changes anything stops it again.
+        """
+        self.stop_scroll()
+        self.command(SCROLL_LEFT, 0x00, first_page, SCROLL_5_FRAMES, last_page,
+                     0x00, 0xFF, SCROLL_START)
+        self._scrolling = True
+
+    def stop_scroll(self):
+        if not self._scrolling:
+            return
+        self.command(SCROLL_STOP)
+        self._scrolling = False
+        # The datasheet wants RAM rewritten after a scroll, so the next
+        # frame goes out in full
+        self._prev_buf = None
+
+    def resync(self):
+        """Forget what the panel holds, so the next frame goes out in full"""
+        self._prev_buf = None
+        self._window = None
+
+    def _send_window(self, window, data):
+        # luma's init leaves the panel in horizontal addressing mode, so
+        # the data fills the window row by row without further commands.
+        # Filling the window wraps the pointer back to its start, so the
+        # address command is only needed when the window moves.
+        if window != self._window:
+            first_page, last_page, first_col, last_col = window
+            self.command(
+                self._const.COLUMNADDR, self._colstart + first_col, self._colstart + last_col,
+                self._const.PAGEADDR, first_page, last_page)
+            self._window = window
+        try:
+            self.data(data)
+        except Exception:
+            # A partial write leaves the pointer mid-window
+            self._window = None
+            raise
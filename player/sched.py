@@ -0,0 +1,23 @@
+"""Scheduling for the latency-sensitive GPIO callback thread"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUTTON_PRIORITY = 20  # SCHED_FIFO priority (1-99); well below kernel IRQ threads
+
+def boost_current_thread(priority=BUTTON_PRIORITY):
+    """Move the calling thread to SCHED_FIFO; returns False if not permitted
+
+    The GPIO libraries start their callback threads in C, so this has to
+    be called from inside a callback. Needs root or CAP_SYS_NICE.
+    """
+    try:
+        # On Linux, pid 0 means the calling thread rather than the process
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (AttributeError, OSError) as e:
+        logger.info("Button thread keeps normal priority (%s); "
+                    "run as root or grant python3 cap_sys_nice", e)
+        return False
+    logger.debug("Button thread running SCHED_FIFO at priority %d", priority)
+    return True